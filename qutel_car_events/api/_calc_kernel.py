@@ -0,0 +1,50 @@
+# Copyright (c) 2025, Qutel and contributors
+# License: MIT
+
+"""
+Arithmetic kernel for opportunity item calculations
+
+Compiled with Numba when it is installed, otherwise falls back to plain NumPy.
+"""
+
+import numpy as np
+
+
+def _sequential_sum(values):
+    # ndarray.sum() uses pairwise summation; accumulate adds left to right so totals
+    # match the Numba loop and a plain Python loop to the last bit
+    return float(np.add.accumulate(values)[-1]) if values.size else 0.0
+
+
+def _compute_numpy(qty, rate, cf, people):
+    stock_qty = qty * cf
+    amount = stock_qty * rate
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stock_uom_rate = np.where(cf > 0, rate / cf, 0.0)
+    return stock_qty, amount, stock_uom_rate, _sequential_sum(people), _sequential_sum(amount)
+
+
+def _compute_loop(qty, rate, cf, people):
+    n = qty.shape[0]
+    stock_qty = np.empty(n)
+    amount = np.empty(n)
+    stock_uom_rate = np.empty(n)
+    total_people = 0.0
+    total_amount = 0.0
+    
+    for i in range(n):
+        stock_qty[i] = qty[i] * cf[i]
+        amount[i] = stock_qty[i] * rate[i]
+        stock_uom_rate[i] = rate[i] / cf[i] if cf[i] > 0 else 0.0
+        total_people += people[i]
+        total_amount += amount[i]
+    
+    return stock_qty, amount, stock_uom_rate, total_people, total_amount
+
+
+try:
+    from numba import njit
+except ImportError:
+    compute = _compute_numpy
+else:
+    compute = njit(cache=True)(_compute_loop)
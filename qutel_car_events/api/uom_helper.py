@@ -8,10 +8,78 @@ This module provides helper functions for fetching and managing UOM (Unit of Mea
 and conversion factors instead of relying on client-side cache, improving performance and reliability.
 """
 
+import time
+from collections import defaultdict, deque
+
 import frappe
+import numpy as np
 from frappe import _
+from frappe.utils import flt, getdate, date_diff
 from typing import Dict, List, Optional, Any
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# Custom fields on Opportunity Item required by this app
+_EXPECTED_OPP_ITEM_FIELDS = ('custom_stock_qty', 'custom_stock_uom_rate', 'custom__people_qty')
+_EXPECTED_OPP_ITEM_FIELD_SET = frozenset(_EXPECTED_OPP_ITEM_FIELDS)
+
+# Error Log rate limit: at most _ERROR_LOG_LIMIT entries per _ERROR_LOG_WINDOW seconds per site
+_ERROR_LOG_LIMIT = 10
+_ERROR_LOG_WINDOW = 60
+_error_log_times = defaultdict(lambda: deque(maxlen=_ERROR_LOG_LIMIT))
+
+
+def _should_log():
+    """
+    In-process rate limiter for Error Log writes, keyed by site so one tenant's
+    error storm does not silence logging for other sites served by the same worker
+    """
+    times = _error_log_times[frappe.local.site]
+    now = time.monotonic()
+    if len(times) == _ERROR_LOG_LIMIT and now - times[0] < _ERROR_LOG_WINDOW:
+        return False
+    times.append(now)
+    return True
+
+
+def _log_error(title):
+    """
+    Log the current exception, formatting the traceback only when the entry is actually written
+    """
+    if frappe.conf.get("developer_mode") or _should_log():
+        frappe.log_error(title=title, message=frappe.get_traceback())
+
+
+def _allow_uom_conversion():
+    """
+    Read Stock Settings.allow_uom_with_conversion_rate_defined_in_item from the document cache
+    
+    The value is memoized on frappe.local so repeated calls within the same request skip
+    the cache layer too. Saving Stock Settings clears the cached document.
+    """
+    if not hasattr(frappe.local, "_qutel_allow_uom"):
+        frappe.local._qutel_allow_uom = frappe.get_cached_value(
+            "Stock Settings",
+            "Stock Settings",
+            "allow_uom_with_conversion_rate_defined_in_item"
+        )
+    return frappe.local._qutel_allow_uom
+
+
+def _get_item_uom_rows(item_code):
+    """
+    Fetch UOM Conversion Detail rows of an item without loading the full Item document
+    """
+    return frappe.get_all(
+        "UOM Conversion Detail",
+        filters={"parent": item_code, "parenttype": "Item"},
+        fields=["uom", "conversion_factor"],
+        order_by="idx"
+    )
+
 
 @frappe.whitelist()
 def get_item_uoms_with_conversion(item_code: str) -> Dict[str, Any]:
@@ -29,15 +97,13 @@ def get_item_uoms_with_conversion(item_code: str) -> Dict[str, Any]:
     
     try:
         # Fetch basic item information
-        item = frappe.get_cached_doc("Item", item_code)
+        item = frappe.db.get_value("Item", item_code, ["stock_uom", "name"], as_dict=True)
         if not item:
             return {"success": False, "message": _("Item not found")}
         
         # Check Stock Settings configuration
-        allow_uom_conversion = frappe.db.get_single_value(
-            "Stock Settings", 
-            "allow_uom_with_conversion_rate_defined_in_item"
-        )
+        allow_uom_conversion = _allow_uom_conversion()
+        item_uoms = _get_item_uom_rows(item_code) if allow_uom_conversion else []
         
         result = {
             "success": True,
@@ -48,18 +114,20 @@ def get_item_uoms_with_conversion(item_code: str) -> Dict[str, Any]:
             "allow_uom_conversion": allow_uom_conversion or False
         }
         
-        if allow_uom_conversion and item.uoms:
+        if allow_uom_conversion and item_uoms:
             # Use UOM Conversion Detail if allowed
-            uom_list = []
-            for uom_detail in item.uoms:
-                uom_list.append({
+            # Stock UOM first, others keep the order defined in item
+            stock_first = []
+            others = []
+            for uom_detail in item_uoms:
+                is_stock_uom = uom_detail.uom == item.stock_uom
+                (stock_first if is_stock_uom else others).append({
                     "uom": uom_detail.uom,
                     "conversion_factor": uom_detail.conversion_factor,
-                    "is_stock_uom": uom_detail.uom == item.stock_uom
+                    "is_stock_uom": is_stock_uom
                 })
             
-            # Sort by idx (order defined in item)
-            result["uoms"] = sorted(uom_list, key=lambda x: x["is_stock_uom"], reverse=True)
+            result["uoms"] = stock_first + others
             
         else:
             # Traditional method - fetch stock_uom only
@@ -72,7 +140,7 @@ def get_item_uoms_with_conversion(item_code: str) -> Dict[str, Any]:
         return result
         
     except Exception as e:
-        frappe.log_error(f"Error in get_item_uoms_with_conversion: {str(e)}")
+        _log_error("Error in get_item_uoms_with_conversion")
         return {
             "success": False, 
             "message": _("Error fetching UOM data: {0}").format(str(e))
@@ -114,13 +182,80 @@ def get_uom_conversion_factor(item_code: str, uom: str) -> Dict[str, Any]:
             }
             
     except Exception as e:
-        frappe.log_error(f"Error in get_uom_conversion_factor: {str(e)}")
+        _log_error("Error in get_uom_conversion_factor")
         return {
             "success": False,
             "message": _("Error fetching conversion factor: {0}").format(str(e))
         }
 
 
+@frappe.whitelist()
+def get_conversion_factors_bulk(item_code: str, uoms) -> Dict[str, Any]:
+    """
+    Fetch conversion factors for several units of measure of one item in a single query
+    
+    Args:
+        item_code (str): Item code
+        uoms (list | str): List (or JSON list) of units of measure
+        
+    Returns:
+        Dict[str, Any]: Mapping of UOM to conversion factor
+    """
+    if not item_code or not uoms:
+        return {"success": False, "message": _("Item Code and UOMs are required")}
+    
+    try:
+        if isinstance(uoms, str):
+            uoms = frappe.parse_json(uoms)
+        if not isinstance(uoms, list) or not uoms:
+            return {"success": False, "message": _("UOMs must be a non-empty list")}
+        
+        uoms = list(dict.fromkeys(uoms))
+        stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
+        if not stock_uom:
+            return {"success": False, "message": _("Item {0} not found").format(item_code)}
+        
+        # Same rules as get_item_uoms_and_conversion: item UOM rows and the ERPNext
+        # fallback apply only when Stock Settings allows them, otherwise 1.0
+        conversion_factors = {uom: 1.0 for uom in uoms}
+        item_uoms = _get_item_uom_rows(item_code) if _allow_uom_conversion() else []
+        
+        if item_uoms:
+            item_factors = {}
+            for uom_detail in item_uoms:
+                item_factors.setdefault(uom_detail.uom, uom_detail.conversion_factor)
+            
+            # Resolve UOMs not defined on the item
+            residual = []
+            for uom in uoms:
+                if uom in item_factors:
+                    conversion_factors[uom] = item_factors[uom]
+                elif uom != stock_uom:
+                    residual.append(uom)
+            
+            if residual:
+                from erpnext.stock.get_item_details import get_conversion_factor
+                
+                for uom in residual:
+                    result = get_conversion_factor(item_code, uom)
+                    if result and "conversion_factor" in result:
+                        conversion_factors[uom] = result["conversion_factor"]
+        
+        return {
+            "success": True,
+            "item_code": item_code,
+            "stock_uom": stock_uom,
+            "conversion_factors": conversion_factors
+        }
+        
+    except Exception as e:
+        _log_error("UOM Helper Error")
+        return {
+            "success": False,
+            "message": _("Error fetching conversion factors: {0}").format(str(e))
+        }
+
+
 @frappe.whitelist()
 def get_opportunity_calculations(items_data: str) -> Dict[str, Any]:
     """
@@ -133,48 +268,38 @@ def get_opportunity_calculations(items_data: str) -> Dict[str, Any]:
         Dict[str, Any]: Calculated results for all items
     """
     try:
-        import json
-        from frappe.utils import flt
-        
-        items = json.loads(items_data) if isinstance(items_data, str) else items_data
+        items = _json.loads(items_data) if isinstance(items_data, str) else items_data
         
         if not isinstance(items, list):
             return {"success": False, "message": _("Invalid items data format")}
         
-        results = []
-        total_people = 0
-        total_amount = 0
+        # Imported lazily so Numba compilation is not paid at module import time
+        from qutel_car_events.api._calc_kernel import compute
         
-        for item in items:
-            item_code = item.get("item_code")
-            qty = flt(item.get("qty", 0))
-            rate = flt(item.get("rate", 0))
-            conversion_factor = flt(item.get("conversion_factor", 1))
-            people_qty = flt(item.get("custom__people_qty", 0))
-            
-            # Calculate quantities using standard ERPNext logic
-            stock_qty = qty * conversion_factor
-            
-            # Calculate amount using stock_qty (as in ERPNext)
-            amount = stock_qty * rate
-            
-            # Calculate stock_uom_rate
-            stock_uom_rate = rate / conversion_factor if conversion_factor > 0 else 0
-            
-            # Sum people quantities and amounts
-            total_people += people_qty
-            total_amount += amount
-            
-            results.append({
-                "item_code": item_code,
-                "qty": qty,
-                "rate": rate,
-                "conversion_factor": conversion_factor,
-                "stock_qty": stock_qty,
-                "amount": amount,
-                "stock_uom_rate": stock_uom_rate,
-                "custom__people_qty": people_qty
-            })
+        # Stack numeric inputs into arrays and compute using ERPNext logic:
+        # stock_qty = qty * conversion_factor, amount = stock_qty * rate
+        count = len(items)
+        item_codes = [item.get("item_code") for item in items]
+        qty = np.fromiter((flt(item.get("qty", 0)) for item in items), dtype=np.float64, count=count)
+        rate = np.fromiter((flt(item.get("rate", 0)) for item in items), dtype=np.float64, count=count)
+        cf = np.fromiter((flt(item.get("conversion_factor", 1)) for item in items), dtype=np.float64, count=count)
+        people = np.fromiter((flt(item.get("custom__people_qty", 0)) for item in items), dtype=np.float64, count=count)
+        
+        stock_qty, amount, stock_uom_rate, total_people, total_amount = compute(qty, rate, cf, people)
+        
+        results = [{
+            "item_code": item_code,
+            "qty": q,
+            "rate": r,
+            "conversion_factor": c,
+            "stock_qty": sq,
+            "amount": a,
+            "stock_uom_rate": sr,
+            "custom__people_qty": p
+        } for item_code, q, r, c, sq, a, sr, p in zip(
+            item_codes, qty.tolist(), rate.tolist(), cf.tolist(), stock_qty.tolist(),
+            amount.tolist(), stock_uom_rate.tolist(), people.tolist(), strict=True
+        )]
         
         return {
             "success": True,
@@ -184,7 +309,7 @@ def get_opportunity_calculations(items_data: str) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        frappe.log_error(f"Error in get_opportunity_calculations: {str(e)}", "UOM Helper Error")
+        _log_error("UOM Helper Error")
         return {
             "success": False,
             "message": _("Error calculating amounts: {0}").format(str(e))
@@ -203,10 +328,7 @@ def validate_opportunity_data(opportunity_data: str) -> Dict[str, Any]:
         Dict[str, Any]: Validation results with error messages if any
     """
     try:
-        import json
-        from frappe.utils import getdate, date_diff
-        
-        data = json.loads(opportunity_data) if isinstance(opportunity_data, str) else opportunity_data
+        data = _json.loads(opportunity_data) if isinstance(opportunity_data, str) else opportunity_data
         
         errors = []
         warnings = []
@@ -216,32 +338,42 @@ def validate_opportunity_data(opportunity_data: str) -> Dict[str, Any]:
         opp_end_date = data.get("expected_closing")
         max_people = flt(data.get("custom_opportunity_people_qty", 0))
         
-        if opp_start_date and opp_end_date:
-            if getdate(opp_start_date) > getdate(opp_end_date):
+        # Parse opportunity dates once instead of once per row
+        opp_start = getdate(opp_start_date) if opp_start_date else None
+        opp_end = getdate(opp_end_date) if opp_end_date else None
+        
+        if opp_start and opp_end:
+            if opp_start > opp_end:
                 errors.append(_("Opportunity start date cannot be after expected closing date"))
         
         # Check opportunity items
         items = data.get("items", [])
-        total_people = 0
+        total_people = sum(flt(item.get("custom__people_qty", 0)) for item in items)
+        
+        # Decide once which comparisons against opportunity dates can apply
+        need_start_check = opp_start is not None
+        need_end_check = opp_end is not None
         
         for idx, item in enumerate(items, 1):
             event_start = item.get("custom_event_start_date")
             event_end = item.get("custom_event_end_date")
-            people_qty = flt(item.get("custom__people_qty", 0))
+            if not event_start and not event_end:
+                continue
             
-            total_people += people_qty
+            ev_s = getdate(event_start) if event_start else None
+            ev_e = getdate(event_end) if event_end else None
             
             # Check event dates
-            if event_start and opp_start_date:
-                if getdate(event_start) < getdate(opp_start_date):
+            if need_start_check and ev_s:
+                if ev_s < opp_start:
                     errors.append(_("Row {0}: Event start date cannot be before opportunity start date").format(idx))
             
-            if event_end and opp_end_date:
-                if getdate(event_end) > getdate(opp_end_date):
+            if need_end_check and ev_e:
+                if ev_e > opp_end:
                     errors.append(_("Row {0}: Event end date cannot be after opportunity expected closing").format(idx))
             
-            if event_start and event_end:
-                if getdate(event_start) > getdate(event_end):
+            if ev_s and ev_e:
+                if ev_s > ev_e:
                     errors.append(_("Row {0}: Event start date cannot be after event end date").format(idx))
         
         # Check people count
@@ -257,7 +389,7 @@ def validate_opportunity_data(opportunity_data: str) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        frappe.log_error(f"Error in validate_opportunity_data: {str(e)}")
+        _log_error("Error in validate_opportunity_data")
         return {
             "success": False,
             "message": _("Error validating data: {0}").format(str(e))
@@ -288,8 +420,8 @@ def get_item_uoms_and_conversion(item_code, uom=None):
             }
 
         # Fetch basic item information
-        item_doc = frappe.get_cached_doc("Item", item_code)
-        if not item_doc:
+        item = frappe.db.get_value("Item", item_code, ["stock_uom", "name"], as_dict=True)
+        if not item:
             return {
                 "success": False,
                 "message": _("Item {0} not found").format(item_code),
@@ -298,41 +430,38 @@ def get_item_uoms_and_conversion(item_code, uom=None):
                 "stock_uom": None
             }
 
-        stock_uom = item_doc.stock_uom
+        stock_uom = item.stock_uom
         conversion_factor = 1.0
         uoms = []
 
         # Check Stock Settings configuration
-        allow_custom_uom = frappe.db.get_single_value(
-            "Stock Settings", 
-            "allow_uom_with_conversion_rate_defined_in_item"
-        )
-        
-        if allow_custom_uom and item_doc.uoms:
-            # Use UOM Conversion Detail defined in item
-            for uom_detail in item_doc.uoms:
+        allow_custom_uom = _allow_uom_conversion()
+        item_uoms = _get_item_uom_rows(item_code) if allow_custom_uom else []
+        
+        if allow_custom_uom and item_uoms:
+            # Use UOM Conversion Detail defined in item, capturing the
+            # conversion factor for the required UOM in the same pass
+            found = False
+            for uom_detail in item_uoms:
                 uoms.append({
                     "uom": uom_detail.uom,
                     "conversion_factor": uom_detail.conversion_factor,
                     "is_stock_uom": uom_detail.uom == stock_uom
                 })
+                if uom and not found and uom_detail.uom == uom:
+                    conversion_factor = uom_detail.conversion_factor
+                    found = True
             
-            # Search for conversion factor for required UOM
-            if uom:
-                for uom_detail in item_doc.uoms:
-                    if uom_detail.uom == uom:
-                        conversion_factor = uom_detail.conversion_factor
-                        break
+            if uom and not found:
+                # If UOM not found in item list, check stock_uom
+                if uom == stock_uom:
+                    conversion_factor = 1.0
                 else:
-                    # If UOM not found in item list, check stock_uom
-                    if uom == stock_uom:
-                        conversion_factor = 1.0
-                    else:
-                        # Use standard ERPNext function as fallback
-                        from erpnext.stock.get_item_details import get_conversion_factor
-                        result = get_conversion_factor(item_code, uom)
-                        if result and "conversion_factor" in result:
-                            conversion_factor = result["conversion_factor"]
+                    # Use standard ERPNext function as fallback
+                    from erpnext.stock.get_item_details import get_conversion_factor
+                    result = get_conversion_factor(item_code, uom)
+                    if result and "conversion_factor" in result:
+                        conversion_factor = result["conversion_factor"]
         else:
             # If custom UOM not allowed, use stock_uom only
             uoms = [{
@@ -351,7 +480,7 @@ def get_item_uoms_and_conversion(item_code, uom=None):
         }
         
     except Exception as e:
-        frappe.log_error(f"Error in get_item_uoms_and_conversion: {str(e)}", "UOM Helper Error")
+        _log_error("UOM Helper Error")
         return {
             "success": False,
             "message": _("Error fetching UOM data: {0}").format(str(e)),
@@ -379,30 +508,27 @@ def validate_integration_status():
         }
         
         # Check Stock Settings
-        stock_settings = frappe.get_single("Stock Settings")
         status_report["checks"]["stock_settings"] = {
-            "allow_uom_conversion": stock_settings.allow_uom_with_conversion_rate_defined_in_item,
+            "allow_uom_conversion": _allow_uom_conversion(),
             "status": "OK"
         }
         
         # Check for custom fields existence
-        custom_fields_check = frappe.db.sql("""
-            SELECT fieldname, dt 
-            FROM `tabCustom Field` 
-            WHERE dt = 'Opportunity Item' 
-            AND fieldname IN ('custom_stock_qty', 'custom_stock_uom_rate', 'custom__people_qty')
-        """, as_dict=True)
+        custom_fields_check = frappe.get_all(
+            "Custom Field",
+            filters={"dt": "Opportunity Item", "fieldname": ["in", _EXPECTED_OPP_ITEM_FIELDS]},
+            fields=["fieldname"]
+        )
         
-        expected_fields = ['custom_stock_qty', 'custom_stock_uom_rate', 'custom__people_qty']
-        found_fields = [f['fieldname'] for f in custom_fields_check]
-        missing_fields = set(expected_fields) - set(found_fields)
+        found_fields = [f.fieldname for f in custom_fields_check]
+        missing_fields = _EXPECTED_OPP_ITEM_FIELD_SET.difference(found_fields)
         
         if missing_fields:
             status_report["errors"].append(f"Missing custom fields: {', '.join(missing_fields)}")
             status_report["integration_status"] = "error"
         
         status_report["checks"]["custom_fields"] = {
-            "expected": expected_fields,
+            "expected": list(_EXPECTED_OPP_ITEM_FIELDS),
             "found": found_fields,
             "missing": list(missing_fields),
             "status": "OK" if not missing_fields else "ERROR"
@@ -414,16 +540,23 @@ def validate_integration_status():
                                      fields=["name", "stock_uom"], 
                                      limit=5)
         
-        uom_conversion_status = []
-        for item in sample_items:
-            conversions = frappe.get_all("UOM Conversion Detail",
-                                       filters={"parent": item.name},
-                                       fields=["uom", "conversion_factor"])
-            uom_conversion_status.append({
-                "item": item.name,
-                "stock_uom": item.stock_uom,
-                "conversions_count": len(conversions)
-            })
+        conversion_counts = {}
+        if sample_items:
+            conversion_counts = {
+                row.parent: row.cnt
+                for row in frappe.db.sql("""
+                    SELECT parent, COUNT(*) AS cnt
+                    FROM `tabUOM Conversion Detail`
+                    WHERE parent IN %s
+                    GROUP BY parent
+                """, (tuple(item.name for item in sample_items),), as_dict=True)
+            }
+        
+        uom_conversion_status = [{
+            "item": item.name,
+            "stock_uom": item.stock_uom,
+            "conversions_count": conversion_counts.get(item.name, 0)
+        } for item in sample_items]
         
         status_report["checks"]["uom_conversions"] = {
             "sample_items": uom_conversion_status,
@@ -449,7 +582,7 @@ def validate_integration_status():
         return status_report
         
     except Exception as e:
-        frappe.log_error(f"Error in validate_integration_status: {str(e)}", "Integration Validation Error")
+        _log_error("Integration Validation Error")
         return {
             "success": False,
             "integration_status": "error",
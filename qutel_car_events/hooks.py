@@ -246,7 +246,8 @@ fixtures = [
     {
         "doctype": "Custom Field", 
         "filters": {
-            "dt": ["in", ["Opportunity", "Opportunity Item"]]
+            "dt": ["in", ["Opportunity", "Opportunity Item"]],
+            "module": "Qutel Car Events"
         }
     }
 ]
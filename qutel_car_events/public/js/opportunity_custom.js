@@ -150,6 +150,38 @@ async function fetch_conversion_factor_fallback(frm, cdt, cdn) {
     }
 }
 
+// Fill missing conversion factors for all rows, one batched call per item (run in parallel)
+function fetch_conversion_factors_bulk(frm) {
+    let rows_by_item = {};
+    (frm.doc.items || []).forEach(row => {
+        if (row.item_code && row.uom && !flt(row.conversion_factor)) {
+            (rows_by_item[row.item_code] = rows_by_item[row.item_code] || []).push(row);
+        }
+    });
+    
+    return Promise.all(Object.keys(rows_by_item).map(async item_code => {
+        let rows = rows_by_item[item_code];
+        try {
+            let res = await frappe.call({
+                method: "qutel_car_events.api.uom_helper.get_conversion_factors_bulk",
+                args: {
+                    item_code: item_code,
+                    uoms: [...new Set(rows.map(row => row.uom))]
+                }
+            });
+            
+            if (res && res.message && res.message.success) {
+                let factors = res.message.conversion_factors || {};
+                await Promise.all(rows.map(row =>
+                    frappe.model.set_value(row.doctype, row.name, "conversion_factor", factors[row.uom] || 1.0)
+                ));
+            }
+        } catch (error) {
+            console.error("Error in fetch_conversion_factors_bulk:", error);
+        }
+    }));
+}
+
 // Unified function for calculating all amounts and quantities
 function calculate_amounts_and_quantities(frm, cdt, cdn) {
     let row = locals[cdt][cdn];
@@ -218,6 +250,11 @@ frappe.ui.form.on('Opportunity', {
     onload: function(frm) {
         // Setup UOM query using ERPNext standard
         setup_uom_query(frm);
+    },
+    
+    validate: function(frm) {
+        // Resolve missing conversion factors for all rows in batches before saving
+        return fetch_conversion_factors_bulk(frm);
     }
 });
 